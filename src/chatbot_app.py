@@ -1,13 +1,24 @@
 # src/chatbot_app.py
 
+import asyncio
 import streamlit as st
 from rag_chain import initialize_rag_chain
+from embedding_model import get_embedding_model
+from config import LLM_BACKEND
 import os
 import time
 
 # --- Streamlit UI Configuration ---
 st.set_page_config(page_title="Product Info Chatbot (RAG)", layout="centered")
 
+# --- Load Embedding Model (Cached to run only once per process) ---
+@st.cache_resource
+def load_embedding_model():
+    """
+    Loads the embedding model once and caches it across Streamlit reruns.
+    """
+    return get_embedding_model()
+
 # --- Initialize RAG Chain (Cached to run only once) ---
 @st.cache_resource
 def setup_rag_chain():
@@ -15,7 +26,7 @@ def setup_rag_chain():
     Sets up the RAG chain and caches it to avoid re-initialization on every rerun.
     """
     with st.spinner("Initializing chatbot knowledge base and LLM... This may take a moment."):
-        rag_chain = initialize_rag_chain()
+        rag_chain = initialize_rag_chain(embedding_model=load_embedding_model())
     if rag_chain:
         st.success("Ask me anything about Elsewedy products.")
     else:
@@ -24,6 +35,55 @@ def setup_rag_chain():
 
 rag_chain = setup_rag_chain()
 
+# --- Streaming Response Rendering ---
+# Re-rendering markdown on every token is expensive, so the placeholder is only
+# refreshed once enough new text has arrived or enough time has passed.
+STREAM_RENDER_MIN_CHARS = 32
+STREAM_RENDER_INTERVAL = 0.05 # seconds
+
+class StreamRenderer:
+    """
+    Accumulates streamed chunks and renders them into a placeholder with throttled UI updates.
+    """
+
+    def __init__(self, placeholder):
+        self.placeholder = placeholder
+        self.full_response = ""
+        self.last_rendered = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, chunk: str):
+        self.full_response += chunk
+        now = time.monotonic()
+        if len(self.full_response) - self.last_rendered > STREAM_RENDER_MIN_CHARS or now - self.last_flush > STREAM_RENDER_INTERVAL:
+            self.placeholder.markdown(self.full_response + "▌") # Add blinking cursor effect
+            self.last_rendered = len(self.full_response)
+            self.last_flush = now
+
+    def finish(self) -> str:
+        self.placeholder.markdown(self.full_response)
+        return self.full_response
+
+def stream_response(chain, question: str, placeholder) -> str:
+    """
+    Streams the chain's answer (sync .stream()) into the placeholder.
+    Returns the full response text.
+    """
+    renderer = StreamRenderer(placeholder)
+    for chunk in chain.stream(question):
+        renderer.add(chunk)
+    return renderer.finish()
+
+async def astream_response(chain, question: str, placeholder) -> str:
+    """
+    Streams the chain's answer (async .astream()) into the placeholder.
+    Returns the full response text.
+    """
+    renderer = StreamRenderer(placeholder)
+    async for chunk in chain.astream(question):
+        renderer.add(chunk)
+    return renderer.finish()
+
 # --- Chatbot Interface ---
 st.title("Elsewedy Electric ⚡")
 st.markdown("At Your Service")
@@ -32,44 +92,57 @@ st.markdown("At Your Service")
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
+# All messages go into one container, so the new turn is appended after the history
+chat_container = st.container()
+
 # Display chat messages from history on app rerun
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
+# (Streamlit drops elements that aren't redrawn in a run, so history is always rendered once)
+with chat_container:
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            st.markdown(message["content"])
 
 # Accept user input
 if prompt := st.chat_input("What can I help you with?"):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
-    # Display user message in chat message container
-    with st.chat_message("user"):
-        st.markdown(prompt)
+    with chat_container:
+        # Display user message in chat message container
+        st.chat_message("user").markdown(prompt)
 
-    # Get chatbot response
-    with st.chat_message("assistant"):
-        message_placeholder = st.empty()
+        # Get chatbot response, streamed into a single placeholder
+        message_placeholder = st.chat_message("assistant").empty()
         full_response = ""
         if rag_chain:
             try:
-                # Use .stream() for a more interactive, streaming response
+                # Stream the response for a more interactive experience
                 # Note: Ollama's streaming might be less granular than OpenAI's
                 # For tinyllama, it might still give chunks quickly.
-                for chunk in rag_chain.stream(prompt):
-                    full_response += chunk
-                    message_placeholder.markdown(full_response + "▌") # Add blinking cursor effect
-                message_placeholder.markdown(full_response)
+                if LLM_BACKEND == "llama_cpp":
+                    # ChatOpenAI keeps its async httpx connections bound to the first event loop,
+                    # so a fresh asyncio.run() per turn would fail on later turns. Stream synchronously.
+                    full_response = stream_response(rag_chain, prompt, message_placeholder)
+                else:
+                    # Ollama opens a new aiohttp session per call, so a per-turn event loop is fine
+                    full_response = asyncio.run(astream_response(rag_chain, prompt, message_placeholder))
             except Exception as e:
                 full_response = f"An error occurred: {e}. Please check the console and ensure Ollama is running."
-                st.error(full_response)
+                message_placeholder.error(full_response)
                 print(f"Error during RAG chain invocation: {e}")
         else:
             full_response = "Chatbot is not initialized. Please check the setup messages above."
+            message_placeholder.markdown(full_response)
         st.session_state.messages.append({"role": "assistant", "content": full_response})
 
 # Optional: Add a button to clear chat history
-if st.button("Clear Chat"):
+def clear_chat():
+    """
+    Clears the chat history. Runs as a button callback, before the script reruns,
+    so the cleared history is rendered without an extra rerun.
+    """
     st.session_state.messages = []
-    st.experimental_rerun()
+
+st.button("Clear Chat", on_click=clear_chat)
 
 # st.sidebar.header("Setup Instructions")
 # st.sidebar.markdown("""
@@ -12,21 +12,81 @@ PRODUCT_DOCS_DIR = os.path.join(DATA_DIR, 'product_docs')
 
 # --- Vector Store Configuration ---
 VECTOR_STORE_DIR = os.path.join(PROJECT_ROOT, 'vector_store')
+VECTOR_STORE_BACKEND = "faiss" # "faiss" (in-memory HNSW index) or "chroma"
+# Processed chunks are cached here and reused while the source documents are unchanged
+CHUNKS_CACHE_PATH = os.path.join(VECTOR_STORE_DIR, 'chunks.pkl')
+CHUNKS_MANIFEST_PATH = os.path.join(VECTOR_STORE_DIR, 'chunks_manifest.json')
 CHROMA_DB_PATH = os.path.join(VECTOR_STORE_DIR, 'chroma_db')
 CHROMA_COLLECTION_NAME = "product_info_collection"
+# Embeddings are normalized, so cosine distance is the right metric for the HNSW index.
+# Larger M / construction_ef cost a bit more at build time for better recall and faster queries.
+CHROMA_COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64,
+}
+CHROMA_MAX_BATCH_SIZE = 5000 # Max number of records per collection.add call
+
+# FAISS HNSW index over inner product (= cosine on the normalized embeddings)
+FAISS_INDEX_PATH = os.path.join(VECTOR_STORE_DIR, 'faiss.index')
+FAISS_CHUNKS_DB_PATH = os.path.join(VECTOR_STORE_DIR, 'faiss_chunks.sqlite3') # Chunk texts, fetched lazily by id
+FAISS_HNSW_M = 32
+FAISS_HNSW_EF_CONSTRUCTION = 200
+FAISS_HNSW_EF_SEARCH = 64
 
 # --- Embedding Model Configuration ---
 # You can choose other models from sentence-transformers if needed
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" # A good balance of size and performance
+EMBEDDING_BATCH_SIZE = 128 # Number of texts encoded per forward pass
+
+# --- Quantized ONNX Embedding Model (CPU only) ---
+# On CPU-only machines an int8 ONNX export of the embedding model is used instead of PyTorch,
+# once it has been built with: python src/embedding_model.py --quantize
+# Until then the PyTorch model is used.
+USE_ONNX_EMBEDDINGS_ON_CPU = True
+ONNX_SOURCE_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2" # Hub id of EMBEDDING_MODEL_NAME
+ONNX_EMBEDDING_MODEL_DIR = os.path.join(PROJECT_ROOT, 'models', 'minilm-int8')
+ONNX_BATCH_SIZE = 64
+EMBEDDING_MAX_SEQ_LENGTH = 256 # Max tokens per text, matches the MiniLM sentence-transformers config
 
 # --- LLM Configuration (Ollama) ---
 OLLAMA_BASE_URL = "http://localhost:11434" # Default Ollama URL
 OLLAMA_MODEL_NAME = "tinyllama" # Ensure this model is pulled in Ollama
+# Keep these fixed across requests: Ollama reloads the model when load-time options (e.g. num_ctx) change
+OLLAMA_NUM_CTX = 2048 # tinyllama's context window
+OLLAMA_NUM_THREAD = os.cpu_count()
+OLLAMA_KEEP_ALIVE_SECONDS = 60 * 60 # Keep the model loaded between turns instead of the default 5 minutes
+OLLAMA_KEEP_ALIVE = f"{OLLAMA_KEEP_ALIVE_SECONDS}s"
+
+# --- LLM Backend ---
+# "ollama", or "llama_cpp" for a bare llama.cpp server with OpenAI-compatible streaming, e.g.:
+#   llama-server -m tinyllama.Q4_K_M.gguf -c 2048 -ngl 35 --host 0.0.0.0 --port 8080 --parallel 4
+LLM_BACKEND = "ollama"
+LLAMA_CPP_BASE_URL = "http://localhost:8080/v1"
+LLAMA_CPP_MODEL_NAME = "tinyllama"
+# Sampling settings, used by both backends
+LLM_TEMPERATURE = 0.1
+LLM_TOP_P = 0.9
+LLM_REPEAT_PENALTY = 1.1
+LLM_WARMUP_TIMEOUT = 5 # seconds to wait for the warm-up LLM call during initialization
 
 # --- RAG Configuration ---
 CHUNK_SIZE = 500  # Size of text chunks for embedding
 CHUNK_OVERLAP = 200 # Overlap between chunks to maintain context
 TOP_K_RETRIEVAL = 5 # Number of relevant chunks to retrieve for context
+# Context budget: the model's window (also the llama-server -c value) minus room for the
+# prompt template + question and for the answer, converted to characters with a
+# conservative chars-per-token estimate. 2048 tokens -> 3840 chars, enough for all
+# TOP_K_RETRIEVAL chunks of CHUNK_SIZE, so the cap only trims unusually long contexts.
+PROMPT_RESERVED_TOKENS = 256 # Prompt template + user question
+ANSWER_RESERVED_TOKENS = 512 # Room left for the generated answer
+CHARS_PER_TOKEN_ESTIMATE = 3
+MAX_CONTEXT_CHARS = (OLLAMA_NUM_CTX - PROMPT_RESERVED_TOKENS - ANSWER_RESERVED_TOKENS) * CHARS_PER_TOKEN_ESTIMATE
+RETRIEVAL_SEARCH_TYPE = "similarity" # "similarity" or "mmr" (diversity re-ranking), for either vector store backend
+MMR_FETCH_K = 20 # Candidates fetched before MMR re-ranking
+MMR_LAMBDA_MULT = 0.5 # 1 = pure relevance, 0 = maximum diversity
+RETRIEVAL_CACHE_SIZE = 1024 # Number of normalized questions whose retrieved chunks are cached
 
 # --- Prompt Templates ---
 # This is the system prompt for the RAG chain.
@@ -1,66 +1,182 @@
 # src/data_processor.py
 
 import os
-from typing import List
+import hashlib
+import json
+import pickle
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Optional
 
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
-from config import PRODUCT_DOCS_DIR, CHUNK_SIZE, CHUNK_OVERLAP
+from config import PRODUCT_DOCS_DIR, CHUNK_SIZE, CHUNK_OVERLAP, CHUNKS_CACHE_PATH, CHUNKS_MANIFEST_PATH
+
+# A word with its trailing whitespace, or a leading run of whitespace
+WORD_PATTERN = re.compile(r"\S+\s*|\s+")
+# Stored in the chunk cache manifest, change it whenever the chunking logic changes
+SPLITTER_NAME = "word_window"
+
+def load_file(file_path: str, loader_cls, loader_kwargs: dict) -> List[Document]:
+    """
+    Loads a single file with the given loader class.
+    Errors are reported and an empty list is returned, so one bad file doesn't abort the batch.
+    """
+    file_name = os.path.basename(file_path)
+    try:
+        documents = loader_cls(file_path, **loader_kwargs).load()
+        print(f"Loaded {file_name} ({len(documents)} documents).")
+        return documents
+    except Exception as e:
+        print(f"Error loading {file_name}: {e}")
+        return []
 
 def load_documents(directory: str = PRODUCT_DOCS_DIR) -> List[Document]:
     """
     Loads documents from the specified directory.
     Supports PDF, TXT, and Markdown files.
+    Files are loaded in parallel with a thread pool since each one is independent.
     """
-    documents = []
+    files_to_load = []
     for root, _, files in os.walk(directory):
         for file_name in files:
             file_path = os.path.join(root, file_name)
             if file_name.endswith(".pdf"):
                 print(f"Loading PDF: {file_name}")
-                loader = PyPDFLoader(file_path)
+                files_to_load.append((file_path, PyPDFLoader, {}))
             elif file_name.endswith(".txt"):
                 print(f"Loading TXT: {file_name}")
-                loader = TextLoader(file_path, encoding="utf-8")
+                files_to_load.append((file_path, TextLoader, {"encoding": "utf-8"}))
             elif file_name.endswith((".md", ".markdown")):
                 print(f"Loading Markdown: {file_name}")
-                loader = UnstructuredMarkdownLoader(file_path)
+                files_to_load.append((file_path, UnstructuredMarkdownLoader, {}))
             else:
                 print(f"Skipping unsupported file type: {file_name}")
-                continue
-            try:
-                documents.extend(loader.load())
-            except Exception as e:
-                print(f"Error loading {file_name}: {e}")
+
+    documents = []
+    if files_to_load:
+        max_workers = min(32, (os.cpu_count() or 1) * 4, len(files_to_load))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(load_file, file_path, loader_cls, loader_kwargs)
+                for file_path, loader_cls, loader_kwargs in files_to_load
+            ]
+            for future in as_completed(futures):
+                documents.extend(future.result())
     print(f"Loaded {len(documents)} raw documents.")
     return documents
 
+def get_chunk_id(chunk: Document) -> str:
+    """
+    Returns a stable SHA-1 id for a chunk, computed from its source and content.
+    """
+    key = chunk.metadata.get("source", "") + "::" + chunk.page_content
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+def split_text(text: str, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP) -> List[str]:
+    """
+    Splits text into chunks of at most chunk_size characters, breaking only between words.
+    Consecutive chunks share up to chunk_overlap characters of trailing words.
+    Words are found with a single precompiled regex pass and chunk lengths are tracked
+    incrementally, so no substring is measured twice.
+    """
+    chunks = []
+    window = deque()
+    window_len = 0
+    for match in WORD_PATTERN.finditer(text):
+        word = match.group()
+        # Words longer than a whole chunk are hard-split
+        for start in range(0, len(word), chunk_size):
+            piece = word[start:start + chunk_size]
+            if window and window_len + len(piece) > chunk_size:
+                chunks.append("".join(window).strip())
+                # Keep the trailing words that fit in the overlap (and leave room for the new piece)
+                while window and (window_len > chunk_overlap or window_len + len(piece) > chunk_size):
+                    window_len -= len(window.popleft())
+            window.append(piece)
+            window_len += len(piece)
+    if window:
+        chunks.append("".join(window).strip())
+    return [chunk for chunk in chunks if chunk]
+
 def split_documents(documents: List[Document]) -> List[Document]:
     """
-    Splits loaded documents into smaller chunks using RecursiveCharacterTextSplitter.
+    Splits loaded documents into smaller chunks using split_text.
+    Each chunk gets a content-hash id in metadata['id'].
     """
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        length_function=len,
-        is_separator_regex=False,
-    )
-    chunks = text_splitter.split_documents(documents)
+    chunks = []
+    for document in documents:
+        for text in split_text(document.page_content):
+            chunks.append(Document(page_content=text, metadata=dict(document.metadata)))
+    # Attach a stable content-hash id so unchanged chunks are never re-embedded
+    for chunk in chunks:
+        chunk.metadata["id"] = get_chunk_id(chunk)
     print(f"Split documents into {len(chunks)} chunks.")
     return chunks
 
+def get_documents_manifest(directory: str = PRODUCT_DOCS_DIR) -> dict:
+    """
+    Returns a fingerprint of the document corpus: {path: {mtime, size}} for every file,
+    plus the chunking settings, so any change invalidates the cached chunks.
+    """
+    files = {}
+    for root, _, file_names in os.walk(directory):
+        for file_name in file_names:
+            file_path = os.path.join(root, file_name)
+            stat = os.stat(file_path)
+            files[file_path] = {"mtime": stat.st_mtime, "size": stat.st_size}
+    return {"splitter": SPLITTER_NAME, "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP, "files": files}
+
+def load_cached_chunks(manifest: dict) -> Optional[List[Document]]:
+    """
+    Returns the cached chunks if they were built from an identical manifest, otherwise None.
+    """
+    if not (os.path.exists(CHUNKS_CACHE_PATH) and os.path.exists(CHUNKS_MANIFEST_PATH)):
+        return None
+    try:
+        with open(CHUNKS_MANIFEST_PATH, "r", encoding="utf-8") as f:
+            if json.load(f) != manifest:
+                return None
+        with open(CHUNKS_CACHE_PATH, "rb") as f:
+            return pickle.load(f)
+    except Exception as e:
+        print(f"Error reading cached chunks: {e}")
+        return None
+
+def save_cached_chunks(chunks: List[Document], manifest: dict):
+    """
+    Saves the chunks and the manifest they were built from.
+    """
+    try:
+        os.makedirs(os.path.dirname(CHUNKS_CACHE_PATH), exist_ok=True)
+        with open(CHUNKS_CACHE_PATH, "wb") as f:
+            pickle.dump(chunks, f)
+        # Written last, so a partial write never pairs a new manifest with old chunks
+        with open(CHUNKS_MANIFEST_PATH, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+    except Exception as e:
+        print(f"Error saving cached chunks: {e}")
+
 def get_processed_documents() -> List[Document]:
     """
     Loads and splits all product documents.
+    If the documents are unchanged since the last run, the cached chunks are returned
+    without parsing or splitting anything.
     """
     print("Starting data processing...")
+    manifest = get_documents_manifest()
+    cached_chunks = load_cached_chunks(manifest)
+    if cached_chunks is not None:
+        print(f"Documents unchanged. Loaded {len(cached_chunks)} cached chunks.")
+        return cached_chunks
     raw_documents = load_documents()
     if not raw_documents:
         print("No documents found or loaded. Please ensure product documents are in the 'data/product_docs' directory.")
         return []
     processed_chunks = split_documents(raw_documents)
+    save_cached_chunks(processed_chunks, manifest)
     print("Data processing complete.")
     return processed_chunks
 
@@ -1,32 +1,188 @@
 # src/embedding_model.py
 
+import os
+import sys
+from typing import List
+
+import numpy as np
+import torch
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from config import EMBEDDING_MODEL_NAME
+from langchain_core.embeddings import Embeddings
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_MAX_SEQ_LENGTH,
+    USE_ONNX_EMBEDDINGS_ON_CPU, ONNX_SOURCE_MODEL_NAME, ONNX_EMBEDDING_MODEL_DIR, ONNX_BATCH_SIZE
+)
+
+ONNX_QUANTIZED_FILE_NAME = "model_quantized.onnx"
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embeddings backed by the int8 quantized ONNX export of the
+    sentence-transformers model, run with onnxruntime on CPU.
+    The model must be built first with export_quantized_onnx_model.
+    Produces the same mean-pooled, L2-normalized vectors as HuggingFaceEmbeddings.
+    """
+
+    def __init__(self, model_dir: str = ONNX_EMBEDDING_MODEL_DIR, batch_size: int = ONNX_BATCH_SIZE):
+        if not os.path.exists(os.path.join(model_dir, ONNX_QUANTIZED_FILE_NAME)):
+            raise FileNotFoundError(f"No quantized ONNX model found in '{model_dir}'.")
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size
+        print(f"Loading quantized ONNX embedding model from '{model_dir}'...")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir, use_fast=True)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_dir, file_name=ONNX_QUANTIZED_FILE_NAME, provider="CPUExecutionProvider"
+        )
+        # Single queries are tokenized with a private copy of the Rust tokenizer directly,
+        # skipping transformers' per-call truncation setup and BatchEncoding wrapping.
+        self._query_tokenizer = None
+        if self.tokenizer.is_fast:
+            from tokenizers import Tokenizer
+
+            self._query_tokenizer = Tokenizer.from_str(self.tokenizer.backend_tokenizer.to_str())
+            self._query_tokenizer.enable_truncation(max_length=EMBEDDING_MAX_SEQ_LENGTH)
+            self._query_tokenizer.no_padding()
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            inputs = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=EMBEDDING_MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            token_embeddings = self.model(**inputs).last_hidden_state
+            # Mean-pool over real tokens only, then L2-normalize
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+        if not batches:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.concatenate(batches)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts).tolist()
+
+    def _tokenize_query(self, text: str) -> dict:
+        if self._query_tokenizer is None:
+            return self.tokenizer(text, truncation=True, max_length=EMBEDDING_MAX_SEQ_LENGTH)
+        encoding = self._query_tokenizer.encode(text)
+        return {
+            "input_ids": encoding.ids,
+            "attention_mask": encoding.attention_mask,
+            "token_type_ids": encoding.type_ids,
+        }
+
+    def embed_query(self, text: str) -> List[float]:
+        encoding = self._tokenize_query(text)
+        # Unpadded (1, length) inputs built straight from the token ids, so no padding tokens are computed
+        inputs = {
+            name: np.array([encoding[name]], dtype=np.int64)
+            for name in self.tokenizer.model_input_names
+        }
+        token_embeddings = self.model(**inputs).last_hidden_state[0]
+        # A single unpadded query has no masked tokens, so a plain mean is the mean-pool
+        pooled = token_embeddings.mean(axis=0)
+        pooled /= max(float(np.linalg.norm(pooled)), 1e-12)
+        return pooled.astype(np.float32).tolist()
+
+def export_quantized_onnx_model(output_dir: str = ONNX_EMBEDDING_MODEL_DIR):
+    """
+    Exports the embedding model to ONNX and applies dynamic int8 quantization
+    for AVX-512 VNNI CPUs. Equivalent to
+    `optimum-cli onnxruntime quantize --avx512_vnni -m <onnx dir> -o <output_dir>`.
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    from transformers import AutoTokenizer
+
+    print(f"Exporting {ONNX_SOURCE_MODEL_NAME} to ONNX...")
+    model = ORTModelForFeatureExtraction.from_pretrained(ONNX_SOURCE_MODEL_NAME, export=True)
+    quantizer = ORTQuantizer.from_pretrained(model)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    print(f"Quantizing to int8 into '{output_dir}'...")
+    quantizer.quantize(save_dir=output_dir, quantization_config=quantization_config)
+    AutoTokenizer.from_pretrained(ONNX_SOURCE_MODEL_NAME).save_pretrained(output_dir)
+    print("Quantized ONNX embedding model saved.")
+
+def get_embedding_device() -> str:
+    """
+    Returns the best available device for the embedding model: 'cuda', 'mps' or 'cpu'.
+    """
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
 
 def get_embedding_model():
     """
     Initializes and returns a HuggingFaceEmbeddings model for text embedding.
+    On CPU-only machines the int8 OnnxEmbeddings model is returned instead, if it has been built.
     The model will be downloaded locally if not already present.
     """
     print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
-    # Using 'cpu' as device for broader compatibility, you can change to 'cuda' if you have a compatible GPU
-    model_kwargs = {'device': 'cpu'}
+    # Use a GPU if one is available, falling back to 'cpu' for broader compatibility
+    device = get_embedding_device()
+    if device == "cpu" and USE_ONNX_EMBEDDINGS_ON_CPU:
+        try:
+            embeddings = OnnxEmbeddings()
+            print("Embedding model loaded successfully with onnxruntime on 'cpu'.")
+            return embeddings
+        except ImportError as e:
+            print(f"ONNX runtime not available ({e}), falling back to PyTorch.")
+        except FileNotFoundError as e:
+            print(f"{e} Falling back to PyTorch.")
+            print("Run 'python src/embedding_model.py --quantize' once to build the int8 model.")
+        except Exception as e:
+            print(f"Error loading ONNX embedding model: {e}. Falling back to PyTorch.")
+    model_kwargs = {'device': device}
     # Ensure the model is loaded from local files if available
-    encode_kwargs = {'normalize_embeddings': False} # Normalization is often done by vector store
+    # Normalize so query and document vectors are unit length and cosine similarity is a dot product
+    encode_kwargs = {'normalize_embeddings': True, 'batch_size': EMBEDDING_BATCH_SIZE}
     try:
         embeddings = HuggingFaceEmbeddings(
             model_name=EMBEDDING_MODEL_NAME,
             model_kwargs=model_kwargs,
             encode_kwargs=encode_kwargs
         )
-        print("Embedding model loaded successfully.")
+        if device == "cuda":
+            # Half precision roughly halves memory traffic and uses tensor cores
+            embeddings.client.half()
+        print(f"Embedding model loaded successfully on '{device}'.")
         return embeddings
     except Exception as e:
         print(f"Error loading embedding model {EMBEDDING_MODEL_NAME}: {e}")
         print("Please ensure you have an internet connection for the first download, or check model name.")
         return None
 
+def encode_documents(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Encodes all texts in one batched call on the underlying SentenceTransformer.
+    Used for bulk ingestion, where batching keeps the model busy instead of
+    paying per-call overhead.
+    """
+    if not isinstance(embeddings, HuggingFaceEmbeddings):
+        # Other backends (e.g. OnnxEmbeddings) batch internally
+        return embeddings.embed_documents(texts)
+    vectors = embeddings.client.encode(
+        texts,
+        batch_size=EMBEDDING_BATCH_SIZE,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=True
+    )
+    # Chroma's HNSW index expects fp32 vectors, even when the model runs in fp16
+    return vectors.astype(np.float32).tolist()
+
 if __name__ == "__main__":
+    if "--quantize" in sys.argv:
+        export_quantized_onnx_model()
     # Example usage:
     embedding_model = get_embedding_model()
     if embedding_model:
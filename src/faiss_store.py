@@ -0,0 +1,243 @@
+# src/faiss_store.py
+
+import os
+import json
+import sqlite3
+import threading
+from typing import List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    FAISS_INDEX_PATH, FAISS_CHUNKS_DB_PATH,
+    FAISS_HNSW_M, FAISS_HNSW_EF_CONSTRUCTION, FAISS_HNSW_EF_SEARCH
+)
+from embedding_model import encode_documents
+
+def mmr_search(query_vec: np.ndarray, cand_vecs: np.ndarray, k: int, lambda_mult: float) -> List[int]:
+    """
+    Maximal marginal relevance over normalized vectors.
+    All query/candidate and candidate/candidate similarities are computed once up
+    front; each step then only updates a running max of the similarity to the
+    already selected candidates.
+    Returns the indices of the selected candidates, in selection order.
+    """
+    k = min(k, len(cand_vecs))
+    if k <= 0:
+        return []
+    sim_q = cand_vecs @ query_vec
+    sim_cc = cand_vecs @ cand_vecs.T
+    first = int(np.argmax(sim_q))
+    selected = [first]
+    picked = np.zeros(len(cand_vecs), dtype=bool)
+    picked[first] = True
+    max_sim_selected = sim_cc[:, first].copy()
+    while len(selected) < k:
+        scores = lambda_mult * sim_q - (1 - lambda_mult) * max_sim_selected
+        scores = np.where(picked, -np.inf, scores)
+        idx = int(np.argmax(scores))
+        selected.append(idx)
+        picked[idx] = True
+        np.maximum(max_sim_selected, sim_cc[:, idx], out=max_sim_selected)
+    return selected
+
+class MMRFaiss(FAISS):
+    """
+    LangChain FAISS vector store whose MMR search uses the vectorized mmr_search.
+    """
+
+    def max_marginal_relevance_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        *,
+        k: int = 4,
+        fetch_k: int = 20,
+        lambda_mult: float = 0.5,
+        filter=None
+    ) -> List[Tuple[Document, float]]:
+        if filter is not None:
+            return super().max_marginal_relevance_search_with_score_by_vector(
+                embedding, k=k, fetch_k=fetch_k, lambda_mult=lambda_mult, filter=filter
+            )
+        query_vec = np.asarray(embedding, dtype=np.float32)
+        scores, indices = self.index.search(query_vec[None, :], fetch_k)
+        found = indices[0] != -1
+        scores, indices = scores[0][found], indices[0][found]
+        if len(indices) == 0:
+            return []
+        cand_vecs = self.index.reconstruct_batch(indices)
+        return [
+            (self.docstore.search(self.index_to_docstore_id[int(indices[i])]), float(scores[i]))
+            for i in mmr_search(query_vec, cand_vecs, k, lambda_mult)
+        ]
+
+# The index is only searched after loading. The HNSW graph and vectors are read
+# fully into memory; chunk texts stay on disk in SQLite.
+FAISS_READ_FLAGS = faiss.IO_FLAG_READ_ONLY
+
+class SqliteDocstore(Docstore):
+    """
+    Read-only docstore that fetches chunks from SQLite by id on demand,
+    so chunk texts don't have to be held in memory.
+    """
+
+    def __init__(self, db_path: str = FAISS_CHUNKS_DB_PATH):
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT text, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def ids_in_index_order(self) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute("SELECT id FROM chunks ORDER BY position").fetchall()
+        return [row[0] for row in rows]
+
+def build(
+    embeddings: np.ndarray,
+    documents: List[Document],
+    index_path: str = FAISS_INDEX_PATH,
+    db_path: str = FAISS_CHUNKS_DB_PATH
+) -> faiss.Index:
+    """
+    Builds an HNSW inner-product index over the (normalized) embeddings and
+    persists it, together with a SQLite table of the chunks keyed by id
+    (position = row in the index).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    index = faiss.IndexHNSWFlat(embeddings.shape[1], FAISS_HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = FAISS_HNSW_EF_CONSTRUCTION
+    index.add(embeddings)
+    os.makedirs(os.path.dirname(index_path), exist_ok=True)
+    faiss.write_index(index, index_path)
+
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    connection = sqlite3.connect(db_path)
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE chunks(id TEXT PRIMARY KEY, position INTEGER, text TEXT, source TEXT, metadata TEXT)"
+            )
+            connection.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?, ?)",
+                [
+                    (doc.metadata["id"], position, doc.page_content,
+                     doc.metadata.get("source", ""), json.dumps(doc.metadata))
+                    for position, doc in enumerate(documents)
+                ]
+            )
+    finally:
+        connection.close()
+    return index
+
+def load(
+    index_path: str = FAISS_INDEX_PATH,
+    db_path: str = FAISS_CHUNKS_DB_PATH
+) -> Optional[Tuple[faiss.Index, SqliteDocstore]]:
+    """
+    Loads a persisted index into memory and opens its chunk store,
+    or returns None if either is missing.
+    """
+    if not (os.path.exists(index_path) and os.path.exists(db_path)):
+        return None
+    index = faiss.read_index(index_path, FAISS_READ_FLAGS)
+    return index, SqliteDocstore(db_path)
+
+def to_vector_store(index: faiss.Index, docstore: SqliteDocstore, embedding_model: Embeddings) -> FAISS:
+    """
+    Wraps a raw index and its chunk store in LangChain's FAISS vector store
+    (with the vectorized MMR search).
+    """
+    index.hnsw.efSearch = FAISS_HNSW_EF_SEARCH
+    return MMRFaiss(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=dict(enumerate(docstore.ids_in_index_order())),
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+def get_faiss_store_count(
+    index_path: str = FAISS_INDEX_PATH,
+    db_path: str = FAISS_CHUNKS_DB_PATH
+) -> int:
+    """
+    Returns the number of chunks in the persisted FAISS store, or 0 if there is none.
+    Counts rows in the SQLite chunk table (one per index vector) rather than
+    reading the whole index from disk.
+    """
+    if not (os.path.exists(index_path) and os.path.exists(db_path)):
+        return 0
+    try:
+        connection = sqlite3.connect(db_path)
+        try:
+            return connection.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        finally:
+            connection.close()
+    except Exception as e:
+        print(f"Error counting chunks in FAISS store: {e}")
+        return 0
+
+def get_or_create_faiss_store(
+    documents: List[Document],
+    embedding_model: Embeddings,
+    index_path: str = FAISS_INDEX_PATH,
+    db_path: str = FAISS_CHUNKS_DB_PATH,
+    force_recreate: bool = False
+) -> Optional[FAISS]:
+    """
+    Loads the persisted FAISS vector store, or builds it from documents if it
+    doesn't exist yet (or force_recreate is True).
+    """
+    try:
+        if not force_recreate:
+            loaded = load(index_path, db_path)
+            if loaded and loaded[0].ntotal > 0:
+                index, docstore = loaded
+                print(f"FAISS index loaded from '{index_path}' with {index.ntotal} documents.")
+                return to_vector_store(index, docstore, embedding_model)
+
+        if not documents:
+            print("Cannot create FAISS index without documents and no existing index found.")
+            return None
+
+        # Drop repeated chunks, they would only add duplicate vectors
+        documents = list({doc.metadata["id"]: doc for doc in documents}.values())
+        print(f"Embedding {len(documents)} documents for the FAISS index...")
+        embeddings = encode_documents(embedding_model, [doc.page_content for doc in documents])
+        index = build(np.asarray(embeddings, dtype=np.float32), documents, index_path, db_path)
+        print(f"FAISS index built at '{index_path}' with {index.ntotal} documents.")
+        # Chunk texts are served from SQLite, so the in-memory documents can be dropped
+        return to_vector_store(index, SqliteDocstore(db_path), embedding_model)
+    except Exception as e:
+        print(f"Error loading or creating FAISS index: {e}")
+        return None
+
+def get_faiss_retriever(
+    vector_store: FAISS,
+    search_type: str = "similarity",
+    search_kwargs: dict = {"k": 4}
+):
+    """
+    Returns a retriever from the FAISS vector store.
+    search_type "mmr" re-ranks for diversity using search_kwargs fetch_k and lambda_mult.
+    """
+    try:
+        print(f"Retriever created from FAISS index (search type '{search_type}').")
+        return vector_store.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
+    except Exception as e:
+        print(f"Error getting FAISS retriever: {e}")
+        return None
@@ -1,94 +1,331 @@
 # src/rag_chain.py
 
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import aiohttp
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
 from langchain_community.llms import Ollama
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from typing import Optional
 
-from config import OLLAMA_BASE_URL, OLLAMA_MODEL_NAME, RAG_PROMPT_TEMPLATE, TOP_K_RETRIEVAL
+from config import (
+    OLLAMA_BASE_URL, OLLAMA_MODEL_NAME, OLLAMA_NUM_CTX, OLLAMA_NUM_THREAD,
+    OLLAMA_KEEP_ALIVE, OLLAMA_KEEP_ALIVE_SECONDS,
+    LLM_BACKEND, LLM_TEMPERATURE, LLM_TOP_P, LLM_REPEAT_PENALTY, LLM_WARMUP_TIMEOUT,
+    LLAMA_CPP_BASE_URL, LLAMA_CPP_MODEL_NAME,
+    RAG_PROMPT_TEMPLATE, TOP_K_RETRIEVAL, MAX_CONTEXT_CHARS, RETRIEVAL_CACHE_SIZE,
+    VECTOR_STORE_BACKEND, RETRIEVAL_SEARCH_TYPE, MMR_FETCH_K, MMR_LAMBDA_MULT
+)
 from embedding_model import get_embedding_model
-from vector_db_manager import get_or_create_vector_store, get_vector_store_retriever
+from vector_db_manager import get_or_create_vector_store, get_vector_store_count, get_vector_store_retriever
+from faiss_store import get_or_create_faiss_store, get_faiss_store_count, get_faiss_retriever
 from data_processor import get_processed_documents
 
-def format_docs(docs: list[Document]) -> str:
+def format_docs(docs: list[Document], max_chars: int = MAX_CONTEXT_CHARS) -> str:
     """
     Formats a list of documents into a single string for the LLM context.
+    Duplicate chunks are dropped, and chunks are greedily packed in retrieval order
+    while the context stays within max_chars (fewer context tokens = faster prefill).
+    """
+    separator = "\n\n"
+    seen = set()
+    parts = []
+    total_chars = 0
+    for doc in docs:
+        content = doc.page_content
+        if content in seen:
+            continue
+        seen.add(content)
+        added_chars = len(content) + (len(separator) if parts else 0)
+        if total_chars + added_chars > max_chars:
+            continue # Skip chunks that don't fit, a later (shorter) one still might
+        parts.append(content)
+        total_chars += added_chars
+    if not parts and docs:
+        # Even the best chunk alone is too long, so keep a truncated version of it
+        parts.append(docs[0].page_content[:max_chars])
+    return separator.join(parts)
+
+class CachedRetriever:
+    """
+    Wraps a retriever with an in-process LRU cache keyed on the normalized question,
+    so repeated questions skip both the query embedding and the vector search.
+    """
+
+    def __init__(self, retriever, maxsize: int = RETRIEVAL_CACHE_SIZE):
+        self.retriever = retriever
+        self._cached = functools.lru_cache(maxsize=maxsize)(self._retrieve)
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        # The MiniLM tokenizer is uncased, so lowercasing doesn't change the embedding
+        return question.strip().lower()
+
+    def _retrieve(self, question_norm: str) -> tuple[Document, ...]:
+        return tuple(self.retriever.invoke(question_norm))
+
+    def invoke(self, question: str) -> list[Document]:
+        return list(self._cached(self.normalize(question)))
+
+    async def ainvoke(self, question: str) -> list[Document]:
+        return await asyncio.to_thread(self.invoke, question)
+
+    def cache_info(self):
+        """
+        Returns the lru_cache statistics (hits, misses, maxsize, currsize).
+        """
+        return self._cached.cache_info()
+
+# time.monotonic() of the last request that used the Ollama model, None if not used yet
+_ollama_last_used = None
+
+def mark_ollama_model_used():
+    """
+    Records that the Ollama model was just used, which restarts its keep_alive timer.
+    """
+    global _ollama_last_used
+    _ollama_last_used = time.monotonic()
+
+def ollama_model_may_be_cold() -> bool:
+    """
+    Returns True if the Ollama model hasn't been used by this process yet,
+    or its keep_alive period has passed since the last use.
+    """
+    return _ollama_last_used is None or time.monotonic() - _ollama_last_used > OLLAMA_KEEP_ALIVE_SECONDS
+
+async def aload_ollama_model():
+    """
+    Asks Ollama to load the model into memory without generating anything.
+    Run alongside retrieval so a cold model load overlaps with embedding + search
+    instead of delaying the first token.
+    Does nothing while the model is known to be loaded.
+    The model only counts as used once the load request succeeds.
+    """
+    if not ollama_model_may_be_cold():
+        # The model answers the question right after this, which restarts its keep_alive timer
+        mark_ollama_model_used()
+        return
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.post(
+                f"{OLLAMA_BASE_URL}/api/generate",
+                json={
+                    "model": OLLAMA_MODEL_NAME,
+                    "keep_alive": OLLAMA_KEEP_ALIVE,
+                    # Same load-time options as the LLM, otherwise Ollama reloads on the real request
+                    "options": {"num_ctx": OLLAMA_NUM_CTX, "num_thread": OLLAMA_NUM_THREAD}
+                }
+            ) as response:
+                await response.read()
+                response.raise_for_status()
+        mark_ollama_model_used()
+    except Exception as e:
+        print(f"Could not pre-load Ollama model '{OLLAMA_MODEL_NAME}': {e}")
+
+def get_context_retriever(retriever, apreload=None):
+    """
+    Wraps the retriever so async invocations (e.g. rag_chain.astream) run the
+    retrieval concurrently with the apreload coroutine function (e.g. loading the Ollama model).
+    Sync invocations call the retriever directly.
+    """
+    async def aretrieve(question: str) -> list[Document]:
+        if apreload is None:
+            return await retriever.ainvoke(question)
+        docs, _ = await asyncio.gather(retriever.ainvoke(question), apreload())
+        return docs
+
+    return RunnableLambda(retriever.invoke, afunc=aretrieve)
+
+def get_llm():
+    """
+    Initializes and returns the LLM for the configured LLM_BACKEND, or None on failure.
     """
-    return "\n\n".join(doc.page_content for doc in docs)
+    if LLM_BACKEND == "llama_cpp":
+        try:
+            from langchain_openai import ChatOpenAI
 
-def initialize_rag_chain():
+            llm = ChatOpenAI(
+                base_url=LLAMA_CPP_BASE_URL,
+                api_key="sk-none", # llama.cpp server doesn't check the key
+                model=LLAMA_CPP_MODEL_NAME,
+                streaming=True,
+                temperature=LLM_TEMPERATURE,
+                top_p=LLM_TOP_P,
+                # Not an OpenAI parameter, llama-server reads it from the request body
+                extra_body={"repeat_penalty": LLM_REPEAT_PENALTY},
+                # Ask for an uncompressed response so streamed chunks aren't buffered
+                default_headers={"Accept-Encoding": "identity"}
+            )
+            print(f"llama.cpp LLM '{LLAMA_CPP_MODEL_NAME}' initialized at '{LLAMA_CPP_BASE_URL}'.")
+            return llm
+        except Exception as e:
+            print(f"Error initializing llama.cpp LLM: {e}")
+            print(f"Please ensure langchain-openai is installed and llama-server is running at '{LLAMA_CPP_BASE_URL}'.")
+            return None
+
+    try:
+        llm = Ollama(
+            base_url=OLLAMA_BASE_URL,
+            model=OLLAMA_MODEL_NAME,
+            num_ctx=OLLAMA_NUM_CTX,
+            num_thread=OLLAMA_NUM_THREAD,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            temperature=LLM_TEMPERATURE,
+            top_p=LLM_TOP_P,
+            repeat_penalty=LLM_REPEAT_PENALTY
+        )
+        print(f"Ollama LLM '{OLLAMA_MODEL_NAME}' initialized.")
+        return llm
+    except Exception as e:
+        print(f"Error initializing Ollama LLM: {e}")
+        print(f"Please ensure Ollama is running and model '{OLLAMA_MODEL_NAME}' is pulled.")
+        return None
+
+def warm_up_models(embedding_model: Embeddings, llm):
+    """
+    Runs a dummy embedding and a 1-token LLM call so model loading happens during
+    initialization instead of on the first user question.
+    The LLM call is abandoned (not cancelled) after LLM_WARMUP_TIMEOUT seconds; errors are ignored.
+    """
+    start = time.monotonic()
+    try:
+        embedding_model.embed_query("warmup")
+    except Exception as e:
+        print(f"Embedding model warm-up failed: {e}")
+    print(f"Embedding model warmed up in {time.monotonic() - start:.2f}s.")
+
+    start = time.monotonic()
+    # Limit generation to a single token
+    limit_kwargs = {"max_tokens": 1} if LLM_BACKEND == "llama_cpp" else {"num_predict": 1}
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(llm.invoke, "hi", **limit_kwargs)
+    try:
+        future.result(timeout=LLM_WARMUP_TIMEOUT)
+        print(f"LLM warmed up in {time.monotonic() - start:.2f}s.")
+        if LLM_BACKEND == "ollama":
+            mark_ollama_model_used()
+    except FutureTimeoutError:
+        print(f"LLM warm-up still running after {LLM_WARMUP_TIMEOUT}s, continuing without waiting.")
+        # Ollama is reachable and loading the model, so it will be warm shortly
+        if LLM_BACKEND == "ollama":
+            mark_ollama_model_used()
+    except Exception as e:
+        print(f"LLM warm-up failed: {e}")
+    finally:
+        # Let a slow warm-up call finish in the background
+        executor.shutdown(wait=False)
+
+def initialize_rag_chain(embedding_model: Optional[Embeddings] = None):
     """
     Initializes and returns the LangChain RAG chain.
     This function handles loading documents, creating/loading the vector store,
     and setting up the LLM and prompt.
+    An already loaded embedding model can be passed in to avoid reloading it.
     """
     print("Initializing RAG chain...")
 
     # 1. Get embedding model
-    embedding_model = get_embedding_model()
+    if embedding_model is None:
+        embedding_model = get_embedding_model()
     if not embedding_model:
         print("Failed to load embedding model. Exiting RAG chain initialization.")
         return None
 
     # 2. Get processed documents (chunks)
     # This step will load and chunk your product documents.
-    # It will only run if the vector store needs to be created or recreated.
-    processed_documents = get_processed_documents()
-    if not processed_documents:
-        print("No documents found or processed for the knowledge base. "
-              "Please ensure your product documents are in 'data/product_docs'.")
-        # We can still try to load an existing vector store if no new docs are provided
-        # but the RAG chain might not be effective if the store is empty.
+    # It only runs if the vector store is empty and needs to be populated.
+    use_faiss = VECTOR_STORE_BACKEND == "faiss"
+    if use_faiss:
+        stored_count = get_faiss_store_count()
+    else:
+        stored_count = get_vector_store_count(embedding_model)
+    processed_documents = []
+    if stored_count == 0:
+        processed_documents = get_processed_documents()
+        if not processed_documents:
+            print("No documents found or processed for the knowledge base. "
+                  "Please ensure your product documents are in 'data/product_docs'.")
+            # We can still try to load an existing vector store if no new docs are provided
+            # but the RAG chain might not be effective if the store is empty.
+    else:
+        print("Vector store already populated. Skipping document processing.")
 
     # 3. Create or load the vector store
     # If the vector store already exists and is populated, it will be loaded.
     # If not, it will be created from `processed_documents`.
     # We pass processed_documents here so it can be used for initial creation.
-    vector_store = get_or_create_vector_store(
-        documents=processed_documents,
-        embedding_model=embedding_model,
-        force_recreate=False # Set to True if you want to rebuild the DB every time
-    )
+    if use_faiss:
+        vector_store = get_or_create_faiss_store(
+            documents=processed_documents,
+            embedding_model=embedding_model,
+            force_recreate=False # Set to True if you want to rebuild the index every time
+        )
+    else:
+        vector_store = get_or_create_vector_store(
+            documents=processed_documents,
+            embedding_model=embedding_model,
+            force_recreate=False # Set to True if you want to rebuild the DB every time
+        )
     if not vector_store:
         print("Failed to initialize vector store. Exiting RAG chain initialization.")
         return None
 
     # 4. Get the retriever from the vector store
-    retriever = get_vector_store_retriever(
-        embedding_model=embedding_model,
-        search_kwargs={"k": TOP_K_RETRIEVAL}
-    )
+    search_kwargs = {"k": TOP_K_RETRIEVAL}
+    if RETRIEVAL_SEARCH_TYPE == "mmr":
+        search_kwargs.update(fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA_MULT)
+    if use_faiss:
+        retriever = get_faiss_retriever(
+            vector_store,
+            search_type=RETRIEVAL_SEARCH_TYPE,
+            search_kwargs=search_kwargs
+        )
+    else:
+        retriever = get_vector_store_retriever(
+            embedding_model=embedding_model,
+            search_type=RETRIEVAL_SEARCH_TYPE,
+            search_kwargs=search_kwargs
+        )
     if not retriever:
         print("Failed to create retriever. Exiting RAG chain initialization.")
         return None
+    retriever = CachedRetriever(retriever)
 
-    # 5. Initialize the local LLM (Ollama)
-    try:
-        llm = Ollama(base_url=OLLAMA_BASE_URL, model=OLLAMA_MODEL_NAME)
-        print(f"Ollama LLM '{OLLAMA_MODEL_NAME}' initialized.")
-    except Exception as e:
-        print(f"Error initializing Ollama LLM: {e}")
-        print(f"Please ensure Ollama is running and model '{OLLAMA_MODEL_NAME}' is pulled.")
+    # 5. Initialize the local LLM (Ollama or llama.cpp server)
+    llm = get_llm()
+    if not llm:
         return None
 
+    # Only Ollama loads models on demand, llama.cpp server has its model loaded at startup
+    apreload = aload_ollama_model if LLM_BACKEND == "ollama" else None
+
     # 6. Define the RAG prompt template
     prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
 
     # 7. Construct the RAG chain
     # The chain flow:
     # 1. User question comes in.
-    # 2. Retriever finds relevant documents based on the question.
+    # 2. Retriever finds relevant documents based on the question
+    #    (when streamed async with Ollama, the model is loaded at the same time).
     # 3. Retrieved documents are formatted into a single context string.
     # 4. The context and original question are passed to the prompt template.
     # 5. The prompt is sent to the LLM.
     # 6. The LLM's response is parsed as a string.
     rag_chain = (
-        {"context": retriever | RunnableLambda(format_docs), "question": RunnablePassthrough()}
+        {"context": get_context_retriever(retriever, apreload) | format_docs, "question": RunnablePassthrough()}
         | prompt
         | llm
         | StrOutputParser()
     )
+
+    # 8. Warm up the models so the first question doesn't pay their load time
+    warm_up_models(embedding_model, llm)
     print("RAG chain initialized successfully.")
     return rag_chain
 
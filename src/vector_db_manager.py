@@ -2,13 +2,71 @@
 
 import os
 from typing import List
+import chromadb
 from langchain_community.vectorstores import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from typing import Optional
 
-from config import CHROMA_DB_PATH, CHROMA_COLLECTION_NAME
-from embedding_model import get_embedding_model
+from config import CHROMA_DB_PATH, CHROMA_COLLECTION_NAME, CHROMA_COLLECTION_METADATA, CHROMA_MAX_BATCH_SIZE
+from embedding_model import get_embedding_model, encode_documents
+
+def get_chroma_collection(
+    persist_directory: str = CHROMA_DB_PATH,
+    collection_name: str = CHROMA_COLLECTION_NAME
+):
+    """
+    Returns the raw ChromaDB collection, creating it with the configured
+    HNSW metadata if it does not exist yet.
+    """
+    client = chromadb.PersistentClient(path=persist_directory)
+    return client.get_or_create_collection(
+        name=collection_name,
+        metadata=CHROMA_COLLECTION_METADATA
+    )
+
+def bulk_ingest(
+    documents: List[Document],
+    embedding_model: Embeddings,
+    persist_directory: str = CHROMA_DB_PATH,
+    collection_name: str = CHROMA_COLLECTION_NAME
+) -> int:
+    """
+    Embeds documents in batches and adds them directly to the ChromaDB collection.
+    Documents are keyed by their content-hash ids (metadata['id'], set by
+    data_processor.split_documents); repeated chunks are embedded only once.
+    Meant for populating an empty collection (see get_or_create_vector_store),
+    so stored ids are not looked up first.
+    Returns the number of documents actually added.
+    """
+    collection = get_chroma_collection(persist_directory, collection_name)
+    new_documents = []
+    seen_ids = set()
+    for doc in documents:
+        # Skip duplicates within this batch, Chroma rejects repeated ids in one add
+        if doc.metadata["id"] in seen_ids:
+            continue
+        seen_ids.add(doc.metadata["id"])
+        new_documents.append(doc)
+
+    if new_documents:
+        texts = [doc.page_content for doc in new_documents]
+        metadatas = [doc.metadata for doc in new_documents]
+        new_ids = [doc.metadata["id"] for doc in new_documents]
+        print(f"Embedding {len(texts)} documents...")
+        embeddings = encode_documents(embedding_model, texts)
+        # Add in slices, Chroma fails on very large single batches
+        for start in range(0, len(new_ids), CHROMA_MAX_BATCH_SIZE):
+            end = start + CHROMA_MAX_BATCH_SIZE
+            collection.add(
+                ids=new_ids[start:end],
+                documents=texts[start:end],
+                metadatas=metadatas[start:end],
+                embeddings=embeddings[start:end]
+            )
+    print(f"Added {len(new_documents)} documents ({len(documents) - len(new_documents)} duplicates skipped).")
+    return len(new_documents)
+
 def get_or_create_vector_store(
     documents: List[Document],
     embedding_model: Embeddings,
@@ -36,36 +94,19 @@ def get_or_create_vector_store(
         vector_store = Chroma(
             persist_directory=persist_directory,
             embedding_function=embedding_model,
-            collection_name=collection_name
+            collection_name=collection_name,
+            collection_metadata=CHROMA_COLLECTION_METADATA
         )
-        # Check if the collection has any documents
-        # This is a bit of a workaround as Chroma does not expose a direct count
-        # We can try to get a dummy document or check if add_documents was called
-        # For simplicity, we'll rely on the existence of the directory for now,
-        # and always add documents if force_recreate is True or no documents were initially added.
-
-        # A more robust check might involve trying to query and seeing if it fails or returns empty
-        # For now, if documents are provided and force_recreate is False, we assume it's an update or initial load
-        if not force_recreate and documents:
-            print(f"Vector store '{collection_name}' loaded from '{persist_directory}'.")
-            # If documents are provided, we should ensure they are added if they don't exist
-            # This logic needs to be careful not to duplicate.
-            # For simplicity, if documents are passed, we assume we want to add/update.
-            # A real-world app might hash documents to avoid re-adding.
-            if documents:
-                print(f"Adding/updating {len(documents)} documents to the vector store...")
-                vector_store.add_documents(documents)
-                print("Documents added/updated.")
+        # Check if the collection already has documents. If it does, skip re-adding
+        # so restarts don't re-embed the corpus and duplicate vectors.
+        existing_count = vector_store._collection.count()
+        if not force_recreate and existing_count > 0:
+            print(f"Vector store '{collection_name}' loaded from '{persist_directory}' with {existing_count} documents.")
             return vector_store
 
         elif documents: # If force_recreate or no existing documents found, add them
             print(f"Creating/recreating vector store '{collection_name}' at '{persist_directory}' with {len(documents)} documents.")
-            vector_store = Chroma.from_documents(
-                documents=documents,
-                embedding=embedding_model,
-                persist_directory=persist_directory,
-                collection_name=collection_name
-            )
+            bulk_ingest(documents, embedding_model, persist_directory, collection_name)
             print("Vector store created/recreated successfully.")
             return vector_store
         else: # No documents provided, just load existing or create empty
@@ -77,11 +118,15 @@ def get_or_create_vector_store(
         print("Attempting to create a new vector store (this might happen if the collection is truly empty or corrupted).")
         # Fallback to creating a new one if loading fails
         if documents:
+            # Drop repeated chunks, Chroma rejects duplicate ids within one batch
+            documents = list({doc.metadata["id"]: doc for doc in documents}.values())
             vector_store = Chroma.from_documents(
                 documents=documents,
                 embedding=embedding_model,
                 persist_directory=persist_directory,
-                collection_name=collection_name
+                collection_name=collection_name,
+                collection_metadata=CHROMA_COLLECTION_METADATA,
+                ids=[doc.metadata["id"] for doc in documents]
             )
             print("New vector store created successfully after error.")
             return vector_store
@@ -90,28 +135,55 @@ def get_or_create_vector_store(
             return None
 
 
+def get_vector_store_count(
+    embedding_model: Embeddings,
+    persist_directory: str = CHROMA_DB_PATH,
+    collection_name: str = CHROMA_COLLECTION_NAME
+) -> int:
+    """
+    Returns the number of documents stored in the ChromaDB collection.
+    Returns 0 if the collection does not exist or cannot be opened.
+    """
+    if not os.path.exists(persist_directory):
+        return 0
+    try:
+        vector_store = Chroma(
+            persist_directory=persist_directory,
+            embedding_function=embedding_model,
+            collection_name=collection_name,
+            collection_metadata=CHROMA_COLLECTION_METADATA
+        )
+        return vector_store._collection.count()
+    except Exception as e:
+        print(f"Error counting documents in vector store: {e}")
+        return 0
+
+
 def get_vector_store_retriever(
     embedding_model: Embeddings,
     persist_directory: str = CHROMA_DB_PATH,
     collection_name: str = CHROMA_COLLECTION_NAME,
+    search_type: str = "similarity",
     search_kwargs: dict = {"k": 4} # Default to retrieving 4 documents
 ):
     """
     Returns a retriever from the existing ChromaDB vector store.
     Assumes the vector store has already been populated.
+    search_type "mmr" re-ranks for diversity using search_kwargs fetch_k and lambda_mult.
     """
     try:
         vector_store = Chroma(
             persist_directory=persist_directory,
             embedding_function=embedding_model,
-            collection_name=collection_name
+            collection_name=collection_name,
+            collection_metadata=CHROMA_COLLECTION_METADATA
         )
         # Check if the collection is empty before returning retriever
         # This is a heuristic check, not foolproof.
         # A more robust check might involve trying to query.
         # For now, we'll just return the retriever, and issues will surface during RAG.
-        print(f"Retriever created from vector store '{collection_name}'.")
-        return vector_store.as_retriever(search_kwargs=search_kwargs)
+        print(f"Retriever created from vector store '{collection_name}' (search type '{search_type}').")
+        return vector_store.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
     except Exception as e:
         print(f"Error getting vector store retriever: {e}")
         print("Ensure the vector store has been initialized and populated with documents.")